@@ -1,17 +1,167 @@
 import streamlit as st
 import os
+import sys
 import zipfile
 import shutil
+import stat
 import re
+import multiprocessing
+import hashlib
+import threading
+import time
+import itertools
+import tempfile
 import pandas as pd
 from docx import Document
-from docx.shared import Inches, Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-import tempfile
+from PIL import Image, ImageOps
 from io import BytesIO
+from datetime import datetime
+from functools import lru_cache, partial
+from typing import NamedTuple
+from report_builder import build_report
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor, as_completed,
+                                wait, FIRST_COMPLETED)
+
+try:
+    import regex  # optional: releases the GIL while matching, see parse_filenames_bulk
+except ImportError:
+    regex = None
+
+# Whole filename in one pass: the 5 '0' rule fields (or just the project for
+# short names), then an optional duplicate counter such as " (2)" added by
+# file managers, and the extension. Nothing matches across a newline, so the
+# same pattern can scan many newline-joined names (_FILENAME_LINES_RE).
+# Always anchored at both ends: every quantifier is then tried from one start
+# position only, which keeps long or malformed names linear.
+_FILENAME_PATTERN = (
+    r'(?P<Project>[^-\n]*?)'
+    r'(?:-(?P<Tower>[^-\n]*)-(?P<Flat>[^-\n]*)-(?P<Inspector>[^-\n]*)-(?P<Date>.*?)|-.*?)?'
+    r'(?:[^\S\n]\(\d+\))?\.[^.\n]*'
+)
+_FILENAME_RE = re.compile(r'\A' + _FILENAME_PATTERN + r'\Z', re.ASCII)
+_FILENAME_LINES_RE = re.compile(r'^' + _FILENAME_PATTERN + r'$', re.MULTILINE | re.ASCII)
+
+def _concurrent_line_finder(regex_module):
+    """_FILENAME_LINES_RE.finditer, compiled by the regex module to match without the GIL."""
+    compiled = regex_module.compile(_FILENAME_LINES_RE.pattern,
+                                    regex_module.MULTILINE | regex_module.ASCII)
+    return partial(compiled.finditer, concurrent=True)
+
+# Threads only pay off when regex can match on other cores meanwhile
+_THREADED_BULK = regex is not None and (os.cpu_count() or 1) > 1
+if _THREADED_BULK:
+    _find_filename_lines = _concurrent_line_finder(regex)
+else:
+    _find_filename_lines = _FILENAME_LINES_RE.finditer
+# Names per thread when parse_filenames_bulk runs on several threads
+_BULK_CHUNK = 4096
+# Inspection date formats accepted without a warning, e.g. 20-01-2025
+_DATE_FORMATS = ('%d-%m-%Y', '%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y')
+_VALID_EXT = frozenset(('.png', '.jpg', '.jpeg'))
+# Images are shown 2.5" wide (see report_builder), so ~180 DPI is plenty for print
+_MAX_IMAGE_PX = 450
+# Minimum seconds between progress bar updates (each one is a browser round-trip)
+_PROGRESS_INTERVAL = 0.1
+# Reports in flight per worker process; bounds the image and .docx bytes held at once
+_REPORTS_PER_WORKER = 2
+# Shrunk images kept for reuse by preload_images (~40 KB each)
+_SHRUNK_CACHE_SIZE = 256
+# Per-thread ZipFile handles: one handle must not be read from several threads
+_thread_zip = threading.local()
+# Output directories already created by _ensure_dir in this process
+_ensured_dirs = set()
+
+class ParsedFilename(NamedTuple):
+    """
+    One parsed image filename. Immutable, so parses can be cached and shared;
+    use _replace(full_path=...) to attach a path.
+    Fields can also be read by name, e.g. record['Project'].
+    """
+    filename: str
+    Project: str
+    Tower: str
+    Flat: str
+    Inspector: str
+    Date: str
+    full_path: str = ""
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self._fields:
+                raise KeyError(key)
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+# Shared result for empty filenames (e.g. blank cells in the review table)
+_EMPTY_RESULT = ParsedFilename("", "", "", "", "", "")
 
 # --- 1. Helper Functions ---
-def create_embedded_template(save_path):
+def _intern(text):
+    """
+    Shares one string object between records for repeated short tokens
+    (project, tower, flat). Long, mostly unique values are left alone.
+    """
+    return sys.intern(text) if len(text) < 64 else text
+
+def create_embedded_template(save_path=None):
+    """
+    Returns the blank record template as .docx bytes.
+    If save_path is given, the template is also written there
+    (missing parent directories are created).
+    """
+    template_bytes = _build_template()
+    
+    if save_path:
+        directory = os.path.dirname(save_path) or '.'
+        _ensure_dir(directory)
+        # Write a temp file next to the target and swap it in, so a crash
+        # never leaves a half-written template behind
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.docx')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(template_bytes)
+            # mkstemp creates the file as 0600; give it the permissions an
+            # overwrite (or a plain new file) would have had
+            try:
+                mode = stat.S_IMODE(os.stat(save_path).st_mode)
+            except FileNotFoundError:
+                mode = 0o666 & ~_read_umask()
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, save_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return template_bytes
+
+def _ensure_dir(path):
+    """Creates path if needed; each directory is only checked once per process."""
+    if path not in _ensured_dirs:
+        os.makedirs(path, exist_ok=True)
+        _ensured_dirs.add(path)
+
+_ensure_dir.cache_clear = _ensured_dirs.clear
+
+def _read_umask():
+    """
+    Returns the process umask. os.umask can only read it by setting it, which
+    races with other threads creating files, so Linux's read-only copy is
+    preferred.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except OSError:
+        pass
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+@lru_cache(maxsize=1)
+def _build_template():
+    """Builds the template with python-docx; only runs once per process."""
     doc = Document()
     heading = doc.add_heading('Gas Water Heater Inspection Record', level=0)
     heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
@@ -28,17 +178,32 @@ def create_embedded_template(save_path):
             for run in paragraph.runs:
                 run.font.bold = True
 
-    doc.save(save_path)
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
 
-def parse_filename_with_zeros(filename):
+def parse_filename_into(filename, out):
     """
-    Parses filenames using the '0' rule.
-    Format: Project-Tower-Flat-Inspector-Date
-    Rule: If Tower or Flat is '0', treat it as empty.
+    Parses filenames using the '0' rule (see parse_filename_with_zeros) and
+    writes the fields straight into the caller's dict, which is returned.
+    Bulk callers can reuse one dict instead of building a record per name:
+        fields = {}
+        for name in filenames:
+            parse_filename_into(name, fields)
+    The keys are the ParsedFilename fields (full_path is left empty).
     """
     base_name = os.path.splitext(filename)[0]
-    # Remove counters like " (2)"
-    clean_name = re.sub(r'\s\(\d+\)$', '', base_name)
+    # Remove counters like " (2)" with plain string checks
+    clean_name = base_name
+    if base_name.endswith(')'):
+        head, bracket, counter = base_name[:-1].rpartition('(')
+        # ASCII digits and whitespace only, like the re.ASCII patterns.
+        # Full-width counters such as "　(2)" or " (２)" are kept as part of
+        # the name (they were stripped before the patterns became ASCII-only)
+        separator = head[-1:]
+        if (bracket and counter.isascii() and counter.isdecimal()
+                and separator.isascii() and separator.isspace()):
+            clean_name = head[:-1]
     parts = clean_name.split('-')
     
     # Initialize defaults
@@ -67,15 +232,279 @@ def parse_filename_with_zeros(filename):
         # We try to grab the first part as project at minimum
         if len(parts) > 0: project = parts[0]
 
-    return {
-        "filename": filename,
-        "Project": project,
-        "Tower": tower,
-        "Flat": flat,
-        "Inspector": inspector,
-        "Date": date,
-        "full_path": "" # To be filled during file walk
-    }
+    out['filename'] = filename
+    out['Project'] = _intern(project)
+    out['Tower'] = _intern(tower)
+    out['Flat'] = _intern(flat)
+    out['Inspector'] = inspector
+    out['Date'] = date
+    out['full_path'] = ""
+    return out
+
+@lru_cache(maxsize=8192)
+def parse_filename_with_zeros(filename):
+    """
+    Parses filenames using the '0' rule.
+    Format: Project-Tower-Flat-Inspector-Date
+    Rule: If Tower or Flat is '0', treat it as empty.
+    Returns a ParsedFilename (cached per filename).
+    """
+    if not filename:
+        return _EMPTY_RESULT
+    return ParsedFilename(**parse_filename_into(filename, {}))
+
+def compile_filename_parser(pattern=_FILENAME_PATTERN, flags=re.ASCII):
+    r"""
+    Compiles a filename schema once and returns a cached parser for it, e.g.
+        parser = compile_filename_parser(r'(?P<Flat>[^_]*)_(?P<Project>[^.]*)\.jpg')
+        records = [parser(name) for name in filenames]
+    pattern is matched against the whole filename and may use the named groups
+    Project, Tower, Flat, Inspector and Date (missing ones stay empty).
+    The '0' rule still applies. Names that do not match fall back to
+    parse_filename_with_zeros. The parser returns a ParsedFilename.
+    flags defaults to re.ASCII like the built-in patterns; pass 0 for a schema
+    whose \d, \w or \s should match non-ASCII characters.
+    """
+    compiled = re.compile(r'\A(?:' + pattern + r')\Z', flags)
+    
+    @lru_cache(maxsize=8192)
+    def parse(filename):
+        match = compiled.match(filename)
+        if match is None:
+            return parse_filename_with_zeros(filename)
+        fields = match.groupdict()
+        tower = fields.get('Tower') or ''
+        flat = fields.get('Flat') or ''
+        return ParsedFilename(
+            filename,
+            _intern(fields.get('Project') or ''),
+            # --- THE 0 RULE ---
+            "" if tower == '0' else _intern(tower),
+            "" if flat == '0' else _intern(flat),
+            fields.get('Inspector') or '',
+            fields.get('Date') or ''
+        )
+    return parse
+
+def parse_filenames_bulk(filenames):
+    """
+    parse_filename_with_zeros for many filenames at once.
+    Scans all names, joined by newlines, with one regex pass instead of
+    calling the parser per name. Returns a list of ParsedFilename in input order.
+    With the optional regex module installed on a multi-core machine, large
+    batches are split into chunks and scanned on several threads, since regex
+    releases the GIL while matching.
+    """
+    filenames = list(filenames)
+    if any('\n' in name for name in filenames):
+        return [parse_filename_with_zeros(name) for name in filenames]
+    if not _THREADED_BULK or len(filenames) <= _BULK_CHUNK:
+        return _scan_filenames(filenames)
+    
+    chunks = [filenames[i:i + _BULK_CHUNK] for i in range(0, len(filenames), _BULK_CHUNK)]
+    with ThreadPoolExecutor() as pool:
+        return list(itertools.chain.from_iterable(pool.map(_scan_filenames, chunks)))
+
+def _scan_filenames(filenames):
+    """Parses newline-free filenames with one scan over the joined names."""
+    buffer = '\n'.join(filenames)
+    # Every match starts at the beginning of a line, so map line starts to indexes
+    line_index = {}
+    start = 0
+    for i, name in enumerate(filenames):
+        line_index[start] = i
+        start += len(name) + 1
+    
+    results = [None] * len(filenames)
+    for match in _find_filename_lines(buffer):
+        i = line_index[match.start()]
+        fields = match.groupdict('')
+        results[i] = ParsedFilename(
+            filenames[i],
+            _intern(fields['Project']),
+            # --- THE 0 RULE ---
+            "" if fields['Tower'] == '0' else _intern(fields['Tower']),
+            "" if fields['Flat'] == '0' else _intern(fields['Flat']),
+            fields['Inspector'],
+            fields['Date']
+        )
+    
+    # Names the pattern does not cover (e.g. no extension) use the single-file parser
+    return [result if result is not None else parse_filename_with_zeros(name)
+            for result, name in zip(results, filenames)]
+
+def parse_filenames_df(paths):
+    """
+    Vectorised parse_filename_with_zeros for a list of image paths inside the ZIP
+    (plain filenames work too).
+    Returns one row per path, with the same columns as the single-file parser.
+    """
+    paths = list(paths)
+    full_paths = pd.Series(paths, dtype=object)
+    # Folders are cut off first: the pattern itself would also match '/'
+    filenames = pd.Series([path.rpartition('/')[2] for path in paths], dtype=object)
+    # A single str.extract pass yields all of the fields.
+    # Short filenames only keep the project (same fallback as the single-file parser)
+    df = filenames.str.extract(_FILENAME_RE)
+    unmatched = df["Project"].isna()
+    df = df.fillna('')
+    if unmatched.any():
+        # Names the pattern does not cover (e.g. no extension) use the single-file parser
+        df.loc[unmatched, ParsedFilename._fields[1:6]] = [
+            parse_filename_with_zeros(name)[1:6] for name in filenames[unmatched]]
+    df["filename"] = filenames
+    df["full_path"] = full_paths
+
+    # --- THE 0 RULE ---
+    df["Tower"] = df["Tower"].mask(df["Tower"] == '0', '')
+    df["Flat"] = df["Flat"].mask(df["Flat"] == '0', '')
+    # Same token sharing as the other parsers; these columns repeat per site.
+    # Kept as object columns: a string dtype would store copies, not the objects
+    for col in ("Project", "Tower", "Flat"):
+        df[col] = pd.Series([_intern(value) for value in df[col]], index=df.index, dtype=object)
+
+    return df[["filename", "Project", "Tower", "Flat", "Inspector", "Date", "full_path"]]
+
+def group_by_location(df):
+    """
+    Groups reviewed image rows by (Project, Tower, Flat), in first-seen order.
+    Each group takes the inspector and date of its first image, and keeps its
+    images in row order (the parsed data is sorted by path).
+    Returns a list of dicts: project, tower, flat, location, filename,
+    inspector, date, images.
+    """
+    location_cols = ['Project', 'Tower', 'Flat']
+    df = df.dropna(subset=['full_path']).copy()
+    df[location_cols] = df[location_cols].fillna('').astype(str).apply(lambda col: col.str.strip())
+    
+    groups = df.groupby(location_cols, sort=False)
+    keys = groups.head(1).reset_index(drop=True)
+    keys['images'] = groups['full_path'].agg(list).tolist()
+    
+    # --- Table Logic: "Tower Flat" ---
+    # e.g. "5座 1A", or "1A" (if tower empty), or "" (if both empty)
+    keys['location'] = (keys['Tower'] + ' ' + keys['Flat']).str.strip()
+    
+    # --- Filename Logic ---
+    # Join non-empty parts with hyphens
+    # e.g. ["NKIL", "1A"] -> "NKIL-1A.docx"
+    # e.g. ["147 Waterloo"] -> "147 Waterloo.docx"
+    stems = (
+        keys['Project']
+        + ('-' + keys['Tower']).where(keys['Tower'] != '', '')
+        + ('-' + keys['Flat']).where(keys['Flat'] != '', '')
+    ).str.replace('/', '_')
+    
+    # Different groups can still share a name (e.g. "A-B" vs "A" + "B", or
+    # "A/B" vs "A_B"); number the later ones like a file manager: "A-B (2).docx".
+    # Compared case-insensitively, as the ZIP may be extracted on Windows
+    taken = set()
+    filenames = []
+    for stem in stems:
+        name = stem
+        copy_number = 1
+        while name.casefold() in taken:
+            copy_number += 1
+            name = f"{stem} ({copy_number})"
+        taken.add(name.casefold())
+        filenames.append(name + '.docx')
+    keys['filename'] = filenames
+    
+    return [
+        {
+            'project': row.Project,
+            'tower': row.Tower,
+            'flat': row.Flat,
+            'location': row.location,
+            'filename': row.filename,
+            'inspector': row.Inspector,
+            'date': row.Date,
+            'images': row.images
+        }
+        for row in keys.itertuples(index=False)
+    ]
+
+@lru_cache(maxsize=1024)
+def is_valid_date(text):
+    """
+    True if text is a real calendar date in one of _DATE_FORMATS.
+    Only used to warn about typos; reports keep the date exactly as written.
+    """
+    for fmt in _DATE_FORMATS:
+        try:
+            datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return True
+    return False
+
+def shrink_image(image_bytes):
+    """
+    Downscales a photo to fit _MAX_IMAGE_PX and re-encodes it as JPEG.
+    Small JPEGs are returned untouched; unreadable images are returned as-is
+    so that add_picture can report them.
+    """
+    try:
+        with Image.open(BytesIO(image_bytes)) as im:
+            if im.format == 'JPEG' and max(im.size) <= _MAX_IMAGE_PX:
+                return image_bytes
+            # Re-encoding drops EXIF, so apply the camera rotation first
+            im = ImageOps.exif_transpose(im)
+            im.thumbnail((_MAX_IMAGE_PX, _MAX_IMAGE_PX), Image.LANCZOS)
+            out = BytesIO()
+            im.convert('RGB').save(out, 'JPEG', quality=80, optimize=True)
+            return out.getvalue()
+    except Exception:
+        return image_bytes
+
+def _read_zip_member(zip_bytes, name):
+    """Reads one ZIP member through a ZipFile handle owned by the calling thread."""
+    if getattr(_thread_zip, 'source', None) is not zip_bytes:
+        _thread_zip.handle = zipfile.ZipFile(BytesIO(zip_bytes), 'r')
+        _thread_zip.source = zip_bytes
+    return _thread_zip.handle.read(name)
+
+def preload_images(zip_bytes, names, image_pool, shrunk):
+    """
+    Reads a group's images from the ZIP, in the given order, and shrinks them.
+    Both steps run on image_pool (zlib releases the GIL while inflating).
+    Returns the list of image bytes.
+    shrunk maps content hashes to already shrunk images, so a photo that
+    appears under several names is only processed (and pickled) once.
+    It keeps the _SHRUNK_CACHE_SIZE most recently used images.
+    """
+    images = list(image_pool.map(_read_zip_member, itertools.repeat(zip_bytes), names))
+    digests = [hashlib.blake2b(image, digest_size=16).digest() for image in images]
+    # Reinsert hits so the dict stays in least-recently-used order
+    for digest in digests:
+        if digest in shrunk:
+            shrunk[digest] = shrunk.pop(digest)
+    todo = {digest: image for digest, image in zip(digests, images) if digest not in shrunk}
+    shrunk.update(zip(todo, image_pool.map(shrink_image, todo.values())))
+    result = [shrunk[digest] for digest in digests]
+    
+    while len(shrunk) > _SHRUNK_CACHE_SIZE:
+        del shrunk[next(iter(shrunk))]
+    return result
+
+def _report_mp_context():
+    """
+    Multiprocessing context for the report workers.
+    Workers are never forked from this process: the server and the image
+    threads are already running when the first one starts. Where available, they
+    fork from a single-threaded forkserver instead, which is started once and
+    preloads report_builder and this app's imports (streamlit, pandas, PIL).
+    Every worker re-runs the main script before its first task, so with those
+    modules already loaded new workers start in milliseconds instead of
+    importing everything again. Elsewhere (Windows) they are spawned.
+    """
+    try:
+        context = multiprocessing.get_context("forkserver")
+    except ValueError:
+        return multiprocessing.get_context("spawn")
+    app_module = os.path.splitext(os.path.basename(__file__))[0]
+    context.set_forkserver_preload(["report_builder", app_module])
+    return context
 
 # --- 2. Main Streamlit False_Ceiling_Gas_Water_Heater_Inspection ---
 
@@ -100,8 +529,8 @@ def main():
     # Initialize Session State
     if 'processed_data' not in st.session_state:
         st.session_state.processed_data = None
-    if 'temp_dir_obj' not in st.session_state:
-        st.session_state.temp_dir_obj = None
+    if 'zip_bytes' not in st.session_state:
+        st.session_state.zip_bytes = None
 
     # Step 1: Upload
     uploaded_file = st.file_uploader("1. Upload Images ZIP", type="zip")
@@ -110,89 +539,75 @@ def main():
         # Check if we need to process this new file
         if st.button("2. Process & Review Images", type="primary"):
             
-            # Create persistent temp directory for this session
-            st.session_state.temp_dir_obj = tempfile.TemporaryDirectory()
-            temp_dir = st.session_state.temp_dir_obj.name
-            
-            extract_path = os.path.join(temp_dir, "input_images")
-            os.makedirs(extract_path, exist_ok=True)
-            
-            # Extract
-            with zipfile.ZipFile(uploaded_file, 'r') as zip_ref:
-                zip_ref.extractall(extract_path)
-                
-            # Parse Files
-            parsed_records = []
-            valid_extensions = ('.png', '.jpg', '.jpeg')
-            
-            for root_dir, dirs, files in os.walk(extract_path):
-                for file in files:
-                    if file.lower().endswith(valid_extensions):
-                        # Use the new "0" logic function
-                        record = parse_filename_with_zeros(file)
-                        record['full_path'] = os.path.join(root_dir, file)
-                        parsed_records.False_Ceiling_Gas_Water_Heater_Inspectionend(record)
+            # Keep the ZIP in memory; images are read straight from it later
+            st.session_state.zip_bytes = uploaded_file.getvalue()
+            with zipfile.ZipFile(BytesIO(st.session_state.zip_bytes), 'r') as zip_ref:
+                # Set lookup on the lowered extension only; directory entries end
+                # in '/', so they never match
+                image_paths = [name for name in zip_ref.namelist()
+                               if name[name.rfind('.'):].lower() in _VALID_EXT]
             
-            if not parsed_records:
+            if not image_paths:
                 st.error("No valid images found in ZIP.")
             else:
-                # Store in session state as DataFrame
-                st.session_state.processed_data = pd.DataFrame(parsed_records)
-                st.success(f"Processed {len(parsed_records)} images.")
+                # Parse Files (all at once, using the "0" logic) and store in session state,
+                # sorted by path so every group's images are already in order
+                st.session_state.processed_data = parse_filenames_df(image_paths).sort_values(
+                    'full_path', kind='stable', ignore_index=True)
+                # Start a fresh review: drop any open editor's edits of the old table
+                st.session_state.pop("review_editor", None)
+                st.success(f"Processed {len(image_paths)} images.")
+                
+                dates = st.session_state.processed_data['Date']
+                bad_dates = dates[~dates.map(is_valid_date)]
+                if len(bad_dates):
+                    st.warning(f"{len(bad_dates)} images have a missing or invalid date "
+                               f"(e.g. '{bad_dates.iloc[0]}'). Please check them in the review table.")
 
     # Step 2: Review & Edit
     if st.session_state.processed_data is not None:
         st.divider()
         st.subheader("3. Review & Edit Details")
-        st.info("👇 Check the table below. '0' inputs should now be empty cells.")
         
-        # Display Editable Table
-        edited_df = st.data_editor(
-            st.session_state.processed_data,
-            column_order=("Project", "Tower", "Flat", "Inspector", "Date"),
-            disabled=["filename"], 
-            num_rows="dynamic",
-            use_container_width=True,
-            hide_index=True
-        )
+        # The editor sends the whole table to the browser and back on every
+        # rerun, so only build it when the user wants to review
+        if st.checkbox("Show review table"):
+            st.info("👇 Check the table below. '0' inputs should now be empty cells.")
+            
+            # The editor keeps its edits relative to the table it was opened with,
+            # so that table must stay the same until the editor is closed
+            if "review_editor" not in st.session_state:
+                st.session_state.review_base = st.session_state.processed_data
+            
+            # Display Editable Table
+            edited_df = st.data_editor(
+                st.session_state.review_base,
+                key="review_editor",
+                column_order=("Project", "Tower", "Flat", "Inspector", "Date"),
+                disabled=["filename", "full_path"], 
+                num_rows="dynamic",
+                use_container_width=True,
+                hide_index=True
+            )
+            # Keep the edits once the table is hidden again
+            st.session_state.processed_data = edited_df
+        else:
+            st.caption("Reports will use the details from the last review (or as read from the filenames).")
+            edited_df = st.session_state.processed_data
 
         # Step 3: Generate
         st.divider()
         if st.button("4. Confirm & Generate Reports", type="primary"):
             
-            temp_dir = st.session_state.temp_dir_obj.name
-            output_path = os.path.join(temp_dir, "output_docs")
-            os.makedirs(output_path, exist_ok=True)
-            
-            # Create Template
-            template_path = os.path.join(temp_dir, "template.docx")
-            create_embedded_template(template_path)
+            # Create Template (once, in memory)
+            template_bytes = create_embedded_template()
             
             # Group by Unique Location
-            grouped = {}
-            
-            for index, row in edited_df.iterrows():
-                p = row['Project'].strip()
-                t = row['Tower'].strip() if row['Tower'] else ""
-                f = row['Flat'].strip() if row['Flat'] else ""
-                
-                # Create a unique key. 
-                # Note: This key is internal logic only. 
-                # The filename will be generated separately later.
-                key = f"{p}-{t}-{f}"
-                
-                if key not in grouped:
-                    grouped[key] = {
-                        'project': p,
-                        'tower': t,
-                        'flat': f,
-                        'inspector': row['Inspector'],
-                        'date': row['Date'],
-                        'images': []
-                    }
-                
-                img_path = st.session_state.processed_data.loc[index, 'full_path']
-                grouped[key]['images'].False_Ceiling_Gas_Water_Heater_Inspectionend(img_path)
+            # (the editor keeps the hidden, read-only full_path column with each row)
+            grouped = group_by_location(edited_df)
+            if not grouped:
+                st.error("No images left to generate reports from.")
+                return
 
             # Generate Documents
             progress_bar = st.progress(0)
@@ -201,57 +616,51 @@ def main():
             zip_buffer = BytesIO()
             
             try:
-                for i, (key, data) in enumerate(grouped.items()):
-                    doc = Document(template_path)
-                    table = doc.tables[0]
-                    
-                    table.cell(0, 1).text = data['project']
-                    
-                    # --- Table Logic: "Tower Flat" ---
-                    # e.g. "5座 1A", or "1A" (if tower empty), or "" (if both empty)
-                    location_parts = []
-                    if data['tower']: location_parts.False_Ceiling_Gas_Water_Heater_Inspectionend(data['tower'])
-                    if data['flat']: location_parts.False_Ceiling_Gas_Water_Heater_Inspectionend(data['flat'])
+                # Reports go straight into the download ZIP
+                # (stored: .docx files are already compressed)
+                zip_bytes = st.session_state.zip_bytes
+                workers = min(os.cpu_count() or 1, total_groups)
+                with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_STORED) as zf, \
+                        ThreadPoolExecutor() as image_pool, \
+                        ThreadPoolExecutor(max_workers=1) as prefetcher, \
+                        ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=_report_mp_context()) as executor:
+                    written = 0
+                    last_update = time.monotonic()
                     
-                    table.cell(1, 1).text = " ".join(location_parts)
+                    def write_reports(done):
+                        # Each report is written as soon as it is ready, and its
+                        # future (holding the .docx bytes) is then dropped
+                        nonlocal written, last_update
+                        for future in done:
+                            safe_filename, docx_bytes, skipped = future.result()
+                            zf.writestr(safe_filename, docx_bytes)
+                            for message in skipped:
+                                st.warning(message)
+                            written += 1
+                            if written == total_groups or time.monotonic() - last_update > _PROGRESS_INTERVAL:
+                                progress_bar.progress(written / total_groups)
+                                last_update = time.monotonic()
                     
-                    table.cell(2, 1).text = str(data['inspector'])
-                    table.cell(3, 1).text = str(data['date'])
-                    
-                    # Add Images
-                    data['images'].sort()
-                    p = doc.add_paragraph()
-                    p.paragraph_format.line_spacing = 1.2
-                    p.paragraph_format.space_before = Pt(12)
-                    p.paragraph_format.space_after = Pt(12)
-                    
-                    for img_path in data['images']:
-                        try:
-                            run = p.add_run()
-                            run.add_picture(img_path, width=Inches(2.5))
-                            run.add_text(" " * 8)
-                        except Exception as e:
-                            st.warning(f"Skipped image in {key}: {e}")
-                            
-                    # --- Filename Logic ---
-                    # Join non-empty parts with hyphens
-                    # e.g. ["NKIL", "1A"] -> "NKIL-1A.docx"
-                    # e.g. ["147 Waterloo"] -> "147 Waterloo.docx"
-                    filename_parts = [data['project']]
-                    if data['tower']: filename_parts.False_Ceiling_Gas_Water_Heater_Inspectionend(data['tower'])
-                    if data['flat']: filename_parts.False_Ceiling_Gas_Water_Heater_Inspectionend(data['flat'])
-                    
-                    safe_filename_base = "-".join(filename_parts)
-                    safe_filename = f"{safe_filename_base}.docx".replace('/', '_')
-                    
-                    doc.save(os.path.join(output_path, safe_filename))
-                    progress_bar.progress((i + 1) / total_groups)
-                
-                # Zip Creation
-                with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-                    for root, _, files in os.walk(output_path):
-                        for file in files:
-                            zf.write(os.path.join(root, file), arcname=file)
+                    # Workers get the (downscaled) image bytes rather than the ZIP.
+                    # The next group's images are loaded while the current group
+                    # is handed to a worker.
+                    max_in_flight = _REPORTS_PER_WORKER * workers
+                    pending = set()
+                    shrunk = {}
+                    next_images = prefetcher.submit(
+                        preload_images, zip_bytes, grouped[0]['images'], image_pool, shrunk)
+                    for idx, data in enumerate(grouped):
+                        images = next_images.result()
+                        if idx + 1 < total_groups:
+                            next_images = prefetcher.submit(
+                                preload_images, zip_bytes, grouped[idx + 1]['images'], image_pool, shrunk)
+                        pending.add(executor.submit(build_report, template_bytes, {**data, 'images': images}))
+                        # Collect whatever has finished; block only when the window is full
+                        done, pending = wait(pending, timeout=0 if len(pending) < max_in_flight else None,
+                                             return_when=FIRST_COMPLETED)
+                        write_reports(done)
+                    write_reports(as_completed(pending))
                 
                 zip_buffer.seek(0)
                 st.success("✅ Reports Generated Successfully!")
@@ -260,7 +669,7 @@ def main():
                     label="⬇️ Download Reports (ZIP)",
                     data=zip_buffer,
                     file_name="Inspection_Reports.zip",
-                    mime="False_Ceiling_Gas_Water_Heater_Inspectionlication/zip"
+                    mime="application/zip"
                 )
                 
             except Exception as e:
@@ -0,0 +1,53 @@
+"""
+Builds one inspection record .docx per location group.
+Kept apart from the Streamlit app so report worker processes only need
+python-docx, not streamlit, pandas or PIL.
+"""
+import copy
+from io import BytesIO
+from functools import lru_cache
+from docx import Document
+from docx.shared import Inches, Pt
+
+_IMAGE_WIDTH = Inches(2.5)
+_IMAGE_SPACING = Pt(12)
+
+@lru_cache(maxsize=1)
+def _parse_template(template_bytes):
+    """Parses the template once per worker process; callers deep-copy it."""
+    return Document(BytesIO(template_bytes))
+
+def build_report(template_bytes, data):
+    """
+    Builds the record for one location group (as made by group_by_location).
+    data['images'] holds the raw bytes of the group's images, in order.
+    Runs in a worker process, so skipped images are returned as messages
+    instead of being shown directly.
+    Returns (filename, .docx bytes, list of warning messages).
+    """
+    doc = copy.deepcopy(_parse_template(template_bytes))
+    table = doc.tables[0]
+    
+    table.cell(0, 1).text = data['project']
+    table.cell(1, 1).text = data['location']
+    table.cell(2, 1).text = str(data['inspector'])
+    table.cell(3, 1).text = str(data['date'])
+    
+    # Add Images
+    warnings = []
+    p = doc.add_paragraph()
+    p.paragraph_format.line_spacing = 1.2
+    p.paragraph_format.space_before = _IMAGE_SPACING
+    p.paragraph_format.space_after = _IMAGE_SPACING
+    
+    for image_bytes in data['images']:
+        try:
+            run = p.add_run()
+            run.add_picture(BytesIO(image_bytes), width=_IMAGE_WIDTH)
+            run.add_text(" " * 8)
+        except Exception as e:
+            warnings.append(f"Skipped image in {data['filename']}: {e}")
+    
+    buffer = BytesIO()
+    doc.save(buffer)
+    return data['filename'], buffer.getvalue(), warnings
\ No newline at end of file
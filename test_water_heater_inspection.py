@@ -5,6 +5,12 @@ import zipfile
 from unittest.mock import MagicMock, patch, ANY
 import tempfile
 import shutil
+import stat
+import time
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from docx import Document
+from PIL import Image
 
 # IMPORT YOUR false_ceiling_gas_water_heater_inspection MODULE HERE
 # Assuming your script is named 'false_ceiling_gas_water_heater_inspection.py'. If it's different, rename the file or change this import.
@@ -66,4 +72,356 @@ def test_create_embedded_template():
         false_ceiling_gas_water_heater_inspection.create_embedded_template(save_path)
         
         # Verify file exists
-        assert os.path.exists(save_path)
\ No newline at end of file
+        assert os.path.exists(save_path)
+
+def test_create_embedded_template_returns_bytes():
+    """Test if the template is returned in memory when no path is given."""
+    template_bytes = false_ceiling_gas_water_heater_inspection.create_embedded_template()
+    
+    doc = Document(BytesIO(template_bytes))
+    assert len(doc.tables[0].rows) == 4
+
+def test_parse_filenames_df_matches_single_parser():
+    """Test the vectorised parser against the single-file parser."""
+    filenames = [
+        "ProjectA-Tower1-1A-InspectorName-20-01-2025.jpg",
+        "ProjectB-0-0-InspectorB-21-01-2025 (2).jpg",
+        "ProjectC-TowerX-0-InspectorC-22-01-2025.png",
+        "JustProjectName.jpg",
+        "Proj-T1-F1.jpeg",
+        "Proj.A-T1-F1-Insp-20.01.2025 (3).jpg",
+        "Short (2)-Name.JPG",
+        "NoExtension-T1-F1-Insp-20-01-2025",
+    ]
+    df = false_ceiling_gas_water_heater_inspection.parse_filenames_df(
+        ["images/" + name for name in filenames])
+    
+    for row, filename in zip(df.to_dict('records'), filenames):
+        expected = false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros(filename)
+        for col in ("filename", "Project", "Tower", "Flat", "Inspector", "Date"):
+            assert row[col] == expected[col]
+        assert row['full_path'] == "images/" + filename
+
+def test_shrink_image():
+    """Test that large photos are downscaled and bad data is passed through."""
+    buffer = BytesIO()
+    Image.new('RGB', (4000, 3000), 'white').save(buffer, 'PNG')
+    
+    shrunk = false_ceiling_gas_water_heater_inspection.shrink_image(buffer.getvalue())
+    with Image.open(BytesIO(shrunk)) as im:
+        assert im.format == 'JPEG'
+        assert max(im.size) <= false_ceiling_gas_water_heater_inspection._MAX_IMAGE_PX
+    
+    assert false_ceiling_gas_water_heater_inspection.shrink_image(b"not an image") == b"not an image"
+
+def test_group_by_location():
+    """Test grouping of images by Project, Tower and Flat."""
+    df = pd.DataFrame({
+        "Project": ["ProjA ", "ProjA", "ProjB", "ProjA"],
+        "Tower": ["T1", "T1", None, "T2"],
+        "Flat": ["1A", "1A", "", "1A"],
+        "Inspector": ["Insp1", "Insp2", "Insp3", "Insp4"],
+        "Date": ["20-01-2025"] * 4,
+        "full_path": ["a.jpg", "b.jpg", "c.jpg", "d.jpg"],
+    })
+    grouped = false_ceiling_gas_water_heater_inspection.group_by_location(df)
+    
+    assert [(g['project'], g['tower'], g['flat']) for g in grouped] == [
+        ("ProjA", "T1", "1A"), ("ProjB", "", ""), ("ProjA", "T2", "1A")]
+    assert grouped[0]['inspector'] == "Insp1"
+    assert grouped[0]['images'] == ["a.jpg", "b.jpg"]
+
+def test_preload_images_shrinks_duplicates_once():
+    """Test that identical photos under different names are shrunk once."""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        zf.writestr("b.jpg", b"photo")
+        zf.writestr("a.jpg", b"photo")
+        zf.writestr("c.jpg", b"other")
+    
+    shrunk = {}
+    with ThreadPoolExecutor() as pool:
+        images = false_ceiling_gas_water_heater_inspection.preload_images(
+            buffer.getvalue(), ["c.jpg", "b.jpg", "a.jpg"], pool, shrunk)
+    
+    assert images == [b"other", b"photo", b"photo"]
+    assert len(shrunk) == 2
+
+def test_group_by_location_names():
+    """Test the table location text and report filename of each group."""
+    df = pd.DataFrame({
+        "Project": ["太湖花園", "NKIL", "147 Waterloo Road", "A/B"],
+        "Tower": ["5座", "", "", "T1"],
+        "Flat": ["1A", "1A", "", ""],
+        "Inspector": ["譚大文", "陳明", "陳明", "X"],
+        "Date": ["20-01-2025"] * 4,
+        "full_path": ["a.jpg", "b.jpg", "c.jpg", "d.jpg"],
+    })
+    grouped = false_ceiling_gas_water_heater_inspection.group_by_location(df)
+    
+    assert [g['location'] for g in grouped] == ["5座 1A", "1A", "", "T1"]
+    assert [g['filename'] for g in grouped] == [
+        "太湖花園-5座-1A.docx", "NKIL-1A.docx", "147 Waterloo Road.docx", "A_B-T1.docx"]
+
+def test_build_report_starts_from_clean_template():
+    """Test that each report gets its own copy of the template."""
+    buffer = BytesIO()
+    Image.new('RGB', (100, 100), 'red').save(buffer, 'JPEG')
+    template_bytes = false_ceiling_gas_water_heater_inspection.create_embedded_template()
+    data = {"project": "ProjA", "location": "T1 1A", "filename": "ProjA-T1-1A.docx",
+            "inspector": "Insp", "date": "20-01-2025", "images": [buffer.getvalue()] * 2}
+    
+    filename, docx_bytes, warnings = false_ceiling_gas_water_heater_inspection.build_report(template_bytes, data)
+    assert filename == "ProjA-T1-1A.docx"
+    assert warnings == []
+    doc = Document(BytesIO(docx_bytes))
+    assert doc.tables[0].cell(1, 1).text == "T1 1A"
+    assert len(doc.inline_shapes) == 2
+    
+    data.update(project="ProjB", images=[b"not an image"])
+    _, docx_bytes, warnings = false_ceiling_gas_water_heater_inspection.build_report(template_bytes, data)
+    doc = Document(BytesIO(docx_bytes))
+    assert doc.tables[0].cell(0, 1).text == "ProjB"
+    assert len(doc.inline_shapes) == 0
+    assert len(warnings) == 1
+
+def test_parse_filename_result_is_read_only():
+    """Test that cached parses cannot be changed by callers."""
+    filename = "ProjectA-Tower1-1A-InspectorName-20-01-2025.jpg"
+    result = false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros(filename)
+    with pytest.raises(AttributeError):
+        result.full_path = "images/" + filename
+    assert result._replace(full_path="images/" + filename).full_path == "images/" + filename
+    
+    again = false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros(filename)
+    assert again.Project == "ProjectA"
+    assert again['full_path'] == ""
+    with pytest.raises(KeyError):
+        again['Unknown']
+
+def test_create_embedded_template_overwrites_in_place():
+    """Test that saving replaces an existing file and leaves no temp files."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        save_path = os.path.join(tmpdir, "template.docx")
+        with open(save_path, 'wb') as f:
+            f.write(b"old")
+        
+        template_bytes = false_ceiling_gas_water_heater_inspection.create_embedded_template(save_path)
+        
+        with open(save_path, 'rb') as f:
+            assert f.read() == template_bytes
+        assert os.listdir(tmpdir) == ["template.docx"]
+
+def test_parse_filenames_bulk_matches_single_parser():
+    """Test the bulk parser against the single-file parser."""
+    filenames = [
+        "ProjectA-Tower1-1A-InspectorName-20-01-2025.jpg",
+        "ProjectB-0-0-InspectorB-21-01-2025 (2).jpg",
+        "JustProjectName.jpg",
+        "NoExtension-T1-1A-Insp-2025-01-01",
+        "",
+        "Proj-T1-F1-Insp-2025-01-01.jpg",
+    ]
+    results = false_ceiling_gas_water_heater_inspection.parse_filenames_bulk(filenames)
+    
+    assert results == [
+        false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros(name)
+        for name in filenames]
+
+def test_parse_long_malformed_filenames():
+    """Test that very long or malformed names still parse quickly."""
+    filenames = [
+        "a" * 10_000,
+        "-" * 10_000,
+        "a-b-c-d-" + "a." * 5_000 + "b",
+        "a-b-c-d-" + " (1" * 3_000,
+        "P-T-F-I-" + "x" * 10_000 + ".jpg",
+    ]
+    # ZIP paths with many (or dotted) folders
+    paths = filenames + ["a/" * 5_000 + "x", "v1.2/NoExtension-T1-F1-Insp-20-01-2025"]
+    start = time.perf_counter()
+    df = false_ceiling_gas_water_heater_inspection.parse_filenames_df(paths)
+    bulk = false_ceiling_gas_water_heater_inspection.parse_filenames_bulk(filenames)
+    assert time.perf_counter() - start < 1
+    
+    assert df['Date'].iloc[4] == "x" * 10_000
+    assert bulk[4]['Date'] == "x" * 10_000
+    assert df['filename'].iloc[5] == "x"
+    assert df.iloc[6][["filename", "Project", "Date"]].tolist() == [
+        "NoExtension-T1-F1-Insp-20-01-2025", "NoExtension", "20-01-2025"]
+
+def test_compile_filename_parser():
+    """Test a project-specific filename schema."""
+    parser = false_ceiling_gas_water_heater_inspection.compile_filename_parser(
+        r'(?P<Flat>[^_]*)_(?P<Tower>[^_]*)_(?P<Project>[^.]*)\.jpg')
+    
+    result = parser("1A_0_ProjectA.jpg")
+    assert result['Project'] == "ProjectA"
+    assert result['Tower'] == ""
+    assert result['Flat'] == "1A"
+    assert result['Date'] == ""
+    
+    # Names outside the schema use the standard parser
+    filename = "ProjectB-T1-1A-InspectorB-21-01-2025.jpg"
+    assert parser(filename) == false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros(filename)
+    
+    # The default schema is the standard '0' rule format
+    default_parser = false_ceiling_gas_water_heater_inspection.compile_filename_parser()
+    for filename in [filename, "(\u3000 (２).bb\tbab", "太湖花園-5座-1A-譚大文-20-01-2025　(2).jpg"]:
+        assert default_parser(filename) == false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros(filename)
+
+def test_parse_empty_filename_is_shared():
+    """Test that empty filenames all share one empty result."""
+    first = false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros("")
+    false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros.cache_clear()
+    second = false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros("")
+    
+    assert first is second
+    assert tuple(first) == ("", "", "", "", "", "", "")
+
+def test_create_embedded_template_builds_once(tmp_path):
+    """Test that repeated calls reuse the same template bytes."""
+    first = false_ceiling_gas_water_heater_inspection.create_embedded_template()
+    misses = false_ceiling_gas_water_heater_inspection._build_template.cache_info().misses
+    
+    for i in range(3):
+        assert false_ceiling_gas_water_heater_inspection.create_embedded_template(str(tmp_path / f"t{i}.docx")) is first
+    assert false_ceiling_gas_water_heater_inspection._build_template.cache_info().misses == misses
+    assert (tmp_path / "t2.docx").read_bytes() == first
+
+def test_parse_filenames_bulk_in_chunks(monkeypatch):
+    """Test that chunked bulk parsing keeps results in input order."""
+    # Force the multi-threaded path even when the regex module is missing
+    monkeypatch.setattr(false_ceiling_gas_water_heater_inspection, "_THREADED_BULK", True)
+    monkeypatch.setattr(false_ceiling_gas_water_heater_inspection, "_BULK_CHUNK", 3)
+    filenames = [f"Proj{i}-T{i % 3}-0-Insp-2025-01-0{i % 9 + 1}.jpg" for i in range(10)]
+    filenames += ["NoExtension", "Short-Name.png"]
+    
+    expected = [false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros(name) for name in filenames]
+    assert false_ceiling_gas_water_heater_inspection.parse_filenames_bulk(filenames) == expected
+
+def test_is_valid_date():
+    """Test date validation on the parsed Date field."""
+    assert false_ceiling_gas_water_heater_inspection.is_valid_date("20-01-2025")
+    assert false_ceiling_gas_water_heater_inspection.is_valid_date("2025-01-01")
+    assert false_ceiling_gas_water_heater_inspection.is_valid_date("20.01.2025")
+    assert not false_ceiling_gas_water_heater_inspection.is_valid_date("31-02-2025")
+    assert not false_ceiling_gas_water_heater_inspection.is_valid_date("")
+    
+    # The parsed Date field itself is never reformatted
+    result = false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros("Proj-T1-F1-Insp-31-02-2025.jpg")
+    assert result['Date'] == "31-02-2025"
+
+def test_create_embedded_template_creates_directories(tmp_path):
+    """Test saving the template into a folder that does not exist yet."""
+    save_path = tmp_path / "reports" / "2025" / "template.docx"
+    false_ceiling_gas_water_heater_inspection.create_embedded_template(str(save_path))
+    assert save_path.exists()
+    assert str(save_path.parent) in false_ceiling_gas_water_heater_inspection._ensured_dirs
+    
+    false_ceiling_gas_water_heater_inspection._ensure_dir.cache_clear()
+    assert not false_ceiling_gas_water_heater_inspection._ensured_dirs
+
+def test_parse_filename_into_reuses_dict():
+    """Test parsing into a caller-supplied dict."""
+    cache_size = false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros.cache_info().currsize
+    fields = {}
+    for filename in ["ProjectA-T1-1A-InspectorA-20-01-2025.jpg", "NKIL-0-1A-陳明-20-01-2025.jpg"]:
+        result = false_ceiling_gas_water_heater_inspection.parse_filename_into(filename, fields)
+        assert result is fields
+    
+    assert fields == {
+        'filename': "NKIL-0-1A-陳明-20-01-2025.jpg",
+        'Project': "NKIL",
+        'Tower': "",
+        'Flat': "1A",
+        'Inspector': "陳明",
+        'Date': "20-01-2025",
+        'full_path': "",
+    }
+    # Parsed directly, without building (and caching) a ParsedFilename
+    assert false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros.cache_info().currsize == cache_size
+
+def test_parsed_tokens_are_shared():
+    """Test that repeated project/tower/flat values share one string object."""
+    filenames = [f"ProjectAA-T1-1A-Insp-2{i}-01-2025.jpg" for i in range(3)]
+    results = false_ceiling_gas_water_heater_inspection.parse_filenames_bulk(filenames)
+    results.append(false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros("ProjectAA-T1-1A-Other-01-02-2025.png"))
+    df = false_ceiling_gas_water_heater_inspection.parse_filenames_df(["images/" + name for name in filenames])
+    results.extend(df.to_dict('records'))
+    
+    for field in ('Project', 'Tower', 'Flat'):
+        assert len({id(result[field]) for result in results}) == 1
+    assert results[0]['Project'] == "ProjectAA"
+
+def test_ascii_patterns_keep_expected_groups():
+    """Test the ASCII-compiled patterns on ASCII and non-ASCII names."""
+    match = false_ceiling_gas_water_heater_inspection._FILENAME_RE.match("Proj-T1-F1-Insp-2025-01-01.jpg")
+    assert match.group('Project', 'Tower', 'Flat', 'Inspector', 'Date') == ("Proj", "T1", "F1", "Insp", "2025-01-01")
+    
+    # Chinese fields still parse; only ASCII counters like " (2)" are stripped
+    filenames = ["太湖花園-5座-1A-譚大文-20-01-2025 (2).jpg", "太湖花園-5座-1A-譚大文-20-01-2025　(2).jpg"]
+    results = false_ceiling_gas_water_heater_inspection.parse_filenames_bulk(filenames)
+    assert results[0]['Date'] == "20-01-2025"
+    assert results[1]['Date'] == "20-01-2025　(2)"
+    assert results == [false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros(name) for name in filenames]
+
+def test_create_embedded_template_file_mode(tmp_path):
+    """Test that saved templates get normal file permissions."""
+    umask = os.umask(0o022)
+    os.umask(umask)
+    
+    save_path = tmp_path / "template.docx"
+    false_ceiling_gas_water_heater_inspection.create_embedded_template(str(save_path))
+    assert stat.S_IMODE(save_path.stat().st_mode) == 0o666 & ~umask
+    
+    # Overwriting keeps the existing file's permissions
+    save_path.chmod(0o640)
+    false_ceiling_gas_water_heater_inspection.create_embedded_template(str(save_path))
+    assert stat.S_IMODE(save_path.stat().st_mode) == 0o640
+
+def test_group_by_location_unique_filenames():
+    """Test that groups mapping to the same report name get numbered."""
+    df = pd.DataFrame({
+        "Project": ["A-B", "A", "A/B", "A_B", "a-b"],
+        "Tower": ["", "B", "", "", ""],
+        "Flat": [""] * 5,
+        "Inspector": ["X"] * 5,
+        "Date": ["20-01-2025"] * 5,
+        "full_path": ["a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg"],
+    })
+    grouped = false_ceiling_gas_water_heater_inspection.group_by_location(df)
+    
+    assert [g['filename'] for g in grouped] == [
+        "A-B.docx", "A-B (2).docx", "A_B.docx", "A_B (2).docx", "a-b (3).docx"]
+
+def test_preload_images_cache_is_bounded(monkeypatch):
+    """Test that only the most recently used shrunk images are kept."""
+    monkeypatch.setattr(false_ceiling_gas_water_heater_inspection, "_SHRUNK_CACHE_SIZE", 2)
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name in ("a", "b", "c"):
+            zf.writestr(name + ".jpg", name.encode())
+    
+    shrunk = {}
+    with ThreadPoolExecutor() as pool:
+        for names in (["a.jpg", "b.jpg"], ["a.jpg", "c.jpg"]):
+            images = false_ceiling_gas_water_heater_inspection.preload_images(
+                buffer.getvalue(), names, pool, shrunk)
+            assert images == [name[0].encode() for name in names]
+    
+    # "b" was least recently used
+    assert sorted(shrunk.values()) == [b"a", b"c"]
+
+def test_parse_filenames_bulk_with_regex_module(monkeypatch):
+    """Test chunked bulk parsing through the regex module's GIL-free scanner."""
+    regex = pytest.importorskip("regex")
+    monkeypatch.setattr(false_ceiling_gas_water_heater_inspection, "_THREADED_BULK", True)
+    monkeypatch.setattr(false_ceiling_gas_water_heater_inspection, "_BULK_CHUNK", 3)
+    monkeypatch.setattr(false_ceiling_gas_water_heater_inspection, "_find_filename_lines",
+                        false_ceiling_gas_water_heater_inspection._concurrent_line_finder(regex))
+    filenames = [f"Proj{i}-T{i % 3}-0-Insp-2025-01-0{i % 9 + 1} ({i}).jpg" for i in range(10)]
+    filenames += ["太湖花園-5座-1A-譚大文-20-01-2025　(2).jpg", "NoExtension", "Short-Name.png"]
+    
+    expected = [false_ceiling_gas_water_heater_inspection.parse_filename_with_zeros(name) for name in filenames]
+    assert false_ceiling_gas_water_heater_inspection.parse_filenames_bulk(filenames) == expected
\ No newline at end of file